@@ -1,4 +1,6 @@
 import sqlite3
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Optional
@@ -7,16 +9,35 @@ from typing import List, Dict, Optional
 class ConversationDB:
     """SQLite database for conversation history, incidents, and metrics."""
 
+    # Seconds between two opportunistic "PRAGMA optimize" runs
+    OPTIMIZE_INTERVAL = 600
+
     def __init__(self, db_path: Path | str = "conversations.db"):
         self.db_path = Path(db_path)
+        # Single long-lived connection shared across calls (autocommit mode)
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        self._last_optimize = time.monotonic()
         self.init_schema()
 
     def init_schema(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.execute("PRAGMA journal_mode=WAL")
-        c = conn.cursor()
-        # Conversations table
-        c.execute("""
+        conn = self._conn
+        # Planner statistics are only gathered when the indexes are first
+        # created; later refreshes go through the periodic PRAGMA optimize
+        new_indexes = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_conv_user_ts'"
+        ).fetchone() is None
+        conn.executescript("""
+            PRAGMA busy_timeout=5000;
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            PRAGMA cache_size=-20000;  -- 20 MB
+            PRAGMA mmap_size=134217728;  -- 128 MB
+            PRAGMA temp_store=MEMORY;
+            PRAGMA wal_autocheckpoint=1000;
+            PRAGMA analysis_limit=400;  -- bound ANALYZE work done by PRAGMA optimize
+
+            -- Conversations table
             CREATE TABLE IF NOT EXISTS conversations (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id TEXT,
@@ -24,10 +45,9 @@ class ConversationDB:
                 agent_response TEXT,
                 intent TEXT,
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # Incidents table (high-priority events like phishing)
-        c.execute("""
+            );
+
+            -- Incidents table (high-priority events like phishing)
             CREATE TABLE IF NOT EXISTS incidents (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id TEXT,
@@ -36,65 +56,130 @@ class ConversationDB:
                 details TEXT,
                 status TEXT DEFAULT 'open',
                 timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        # Metrics table (awareness tracking)
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                metric_name TEXT,
-                value INTEGER,
-                intent TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
+            );
+
+            -- Indexes for history lookups and open incidents
+            CREATE INDEX IF NOT EXISTS idx_conv_user_ts ON conversations(user_id, timestamp DESC);
+            CREATE INDEX IF NOT EXISTS idx_inc_status_ts ON incidents(status, timestamp DESC);
         """)
-        conn.commit()
-        conn.close()
+        self._init_metrics()
+        if new_indexes:
+            conn.execute("ANALYZE")
+
+    def _init_metrics(self):
+        """Create the metrics counters table, migrating the legacy layout.
+
+        Older databases stored one metrics row per increment. Detection and
+        migration run in one write transaction so concurrent starts cannot
+        migrate twice and a crash cannot leave a half-migrated table.
+        """
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(metrics)")]
+            if "id" in columns:
+                conn.execute("ALTER TABLE metrics RENAME TO metrics_legacy")
+            # Metrics table (awareness tracking, one counter per metric/intent)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS metrics (
+                    metric_name TEXT,
+                    intent TEXT,
+                    value INTEGER DEFAULT 0,
+                    PRIMARY KEY (metric_name, intent)
+                )
+            """)
+            legacy = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'metrics_legacy'"
+            ).fetchone()
+            if legacy:
+                conn.execute("""
+                    INSERT INTO metrics (metric_name, intent, value)
+                    SELECT metric_name, COALESCE(intent, ''), COUNT(*)
+                    FROM metrics_legacy
+                    WHERE true
+                    GROUP BY metric_name, COALESCE(intent, '')
+                    ON CONFLICT (metric_name, intent) DO UPDATE SET value = value + excluded.value
+                """)
+                conn.execute("DROP TABLE metrics_legacy")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def optimize(self):
+        """Let SQLite refresh its query planner statistics."""
+        with self._lock:
+            self._conn.execute("PRAGMA optimize")
+            self._last_optimize = time.monotonic()
+
+    def _maybe_optimize(self):
+        if time.monotonic() - self._last_optimize >= self.OPTIMIZE_INTERVAL:
+            self.optimize()
+
+    def close(self):
+        """Close the underlying database connection."""
+        with self._lock:
+            self._conn.execute("PRAGMA optimize")
+            self._conn.close()
 
     def save_conversation(self, user_id: str, user_msg: str, agent_response: str, intent: str):
         """Save a conversation turn."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO conversations (user_id, user_message, agent_response, intent)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, user_msg, agent_response, intent))
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO conversations (user_id, user_message, agent_response, intent)
+                VALUES (?, ?, ?, ?)
+            """, (user_id, user_msg, agent_response, intent))
+        self._maybe_optimize()
 
     def save_incident(self, user_id: str, intent: str, severity: str, details: str):
         """Log a security incident (phishing, compromise, etc.)."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO incidents (user_id, intent, severity, details)
-            VALUES (?, ?, ?, ?)
-        """, (user_id, intent, severity, details))
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO incidents (user_id, intent, severity, details)
+                VALUES (?, ?, ?, ?)
+            """, (user_id, intent, severity, details))
+        self._maybe_optimize()
 
     def increment_metric(self, metric_name: str, intent: str = ""):
         """Increment a metric counter (e.g., phishing_questions_asked)."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("""
-            INSERT INTO metrics (metric_name, value, intent)
-            VALUES (?, 1, ?)
-        """, (metric_name, intent))
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute("""
+                INSERT INTO metrics (metric_name, intent, value)
+                VALUES (?, ?, 1)
+                ON CONFLICT (metric_name, intent) DO UPDATE SET value = value + 1
+            """, (metric_name, intent))
+        self._maybe_optimize()
+
+    def record_turn(self, user_id: str, user_msg: str, agent_response: str, intent: str,
+                    metric_name: Optional[str] = "question_asked"):
+        """Save a conversation turn and its metric in a single transaction."""
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("""
+                    INSERT INTO conversations (user_id, user_message, agent_response, intent)
+                    VALUES (?, ?, ?, ?)
+                """, (user_id, user_msg, agent_response, intent))
+                if metric_name:
+                    conn.execute("""
+                        INSERT INTO metrics (metric_name, intent, value)
+                        VALUES (?, ?, 1)
+                        ON CONFLICT (metric_name, intent) DO UPDATE SET value = value + 1
+                    """, (metric_name, intent))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        self._maybe_optimize()
 
     def get_metrics_summary(self) -> Dict:
         """Return aggregated metrics for dashboard."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("""
-            SELECT metric_name, intent, COUNT(*) as count 
-            FROM metrics 
-            GROUP BY metric_name, intent
-        """)
-        rows = c.fetchall()
-        conn.close()
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT metric_name, intent, value
+                FROM metrics
+            """).fetchall()
         result = {}
         for metric_name, intent, count in rows:
             key = f"{metric_name}_{intent}" if intent else metric_name
@@ -103,16 +188,13 @@ class ConversationDB:
 
     def get_open_incidents(self) -> List[Dict]:
         """Return all open incidents."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("""
-            SELECT id, user_id, intent, severity, details, timestamp 
-            FROM incidents 
-            WHERE status = 'open'
-            ORDER BY timestamp DESC
-        """)
-        rows = c.fetchall()
-        conn.close()
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT id, user_id, intent, severity, details, timestamp 
+                FROM incidents 
+                WHERE status = 'open'
+                ORDER BY timestamp DESC
+            """).fetchall()
         result = []
         for row in rows:
             result.append({
@@ -127,25 +209,19 @@ class ConversationDB:
 
     def close_incident(self, incident_id: int):
         """Mark an incident as resolved."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("UPDATE incidents SET status = 'closed' WHERE id = ?", (incident_id,))
-        conn.commit()
-        conn.close()
+        with self._lock:
+            self._conn.execute("UPDATE incidents SET status = 'closed' WHERE id = ?", (incident_id,))
 
     def get_conversation_history(self, user_id: str, limit: int = 50) -> List[Dict]:
         """Retrieve conversation history for a user."""
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute("""
-            SELECT user_message, agent_response, intent, timestamp 
-            FROM conversations 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC 
-            LIMIT ?
-        """, (user_id, limit))
-        rows = c.fetchall()
-        conn.close()
+        with self._lock:
+            rows = self._conn.execute("""
+                SELECT user_message, agent_response, intent, timestamp 
+                FROM conversations 
+                WHERE user_id = ? 
+                ORDER BY timestamp DESC 
+                LIMIT ?
+            """, (user_id, limit)).fetchall()
         result = []
         for row in rows:
             result.append({
@@ -1,29 +1,64 @@
 from pathlib import Path
-from typing import List, Tuple
+from typing import Dict, List, Tuple
+import functools
+import os
+import pickle
 import random
+import tempfile
+import numpy as np
+import sklearn
 import yaml
-import pandas as pd
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+
+try:  # libyaml C backend is much faster than the pure-Python loader
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: no cover
+    from yaml import SafeLoader
 
 
 class CyberFAQAgent:
-    def __init__(self, kb_path: Path | None = None, min_similarity: float = 0.15):
-        if kb_path is None:
-            kb_path = Path(__file__).parent / "knowledge_base.yaml"
-        
-        # Ensure path is absolute
-        kb_path = Path(kb_path).resolve()
-        
-        if not kb_path.exists():
-            raise FileNotFoundError(f"Knowledge base not found at {kb_path}")
-        
-        with open(kb_path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
+    # Bump when the corpus or vectorizer setup changes to invalidate on-disk caches
+    CACHE_VERSION = 1
+
+    def __init__(self, kb_path: Path | None = None, min_similarity: float = 0.15,
+                 kb_data: Dict | None = None):
+        cache_path = None
+        cached = None
+        if kb_data is None:
+            if kb_path is None:
+                kb_path = Path(__file__).parent / "knowledge_base.yaml"
+            
+            # Ensure path is absolute
+            kb_path = Path(kb_path).resolve()
+            
+            if not kb_path.exists():
+                raise FileNotFoundError(f"Knowledge base not found at {kb_path}")
+            
+            # Parsed KB + fitted index are cached beside the YAML and rebuilt
+            # whenever the YAML is newer than the cache
+            cache_path = kb_path.with_suffix(".pkl")
+            cached = self._load_cache(cache_path, kb_path)
+            if cached is None:
+                with open(kb_path, "r", encoding="utf-8") as f:
+                    kb_data = yaml.load(f, Loader=SafeLoader)
+            else:
+                kb_data, self.vectorizer, self.matrix, self._M = cached
+        # Parsed knowledge base, shared with the orchestrator (guidance etc.)
+        self.kb_data = data = kb_data or {}
         self.faq = data.get("faq", [])
         self.tips = data.get("tips", [])
         self.min_similarity = min_similarity
 
+        if cached is None:
+            self._build_index()
+            if cache_path is not None:
+                self._save_cache(cache_path)
+
+        # Memoize query vectors: answer() and search() are called with the
+        # same text for each chat turn, and common questions repeat often
+        self._vec = functools.lru_cache(maxsize=1024)(self._transform)
+
+    def _build_index(self):
         # Build corpus including both questions and answers for better matching
         corpus = []
         for item in self.faq:
@@ -33,8 +68,6 @@ class CyberFAQAgent:
             # Combine all text for better semantic matching
             corpus.append(f"{q} {a} {cat}")
         
-        self.df = pd.DataFrame(self.faq)
-        
         # Improved French tokenization
         french_stop_words = [
             'le', 'la', 'les', 'un', 'une', 'des', 'de', 'du', 'et', 'ou', 
@@ -49,10 +82,74 @@ class CyberFAQAgent:
             stop_words=french_stop_words,
             lowercase=True,
             strip_accents='unicode',
-            token_pattern=r'\b\w+\b'
+            token_pattern=r'\b\w+\b',
+            norm='l2'
         )
         self.matrix = self.vectorizer.fit_transform(corpus)
 
+        # Dense float32 copy of the corpus. Rows are already L2-normalized by
+        # the vectorizer, so cosine similarity is a plain matrix-vector product
+        self._M = np.ascontiguousarray(self.matrix.toarray(), dtype=np.float32)
+
+    @classmethod
+    def _load_cache(cls, cache_path: Path, kb_path: Path):
+        """Return (kb_data, vectorizer, matrix, dense) from a fresh cache, else None."""
+        try:
+            if cache_path.stat().st_mtime < kb_path.stat().st_mtime:
+                return None
+            with open(cache_path, "rb") as f:
+                payload = pickle.load(f)
+        except Exception:
+            # Missing, truncated or incompatible cache: rebuild from the YAML
+            return None
+        if payload.get("version") != cls.CACHE_VERSION or payload.get("sklearn") != sklearn.__version__:
+            return None
+        return payload["kb_data"], payload["vectorizer"], payload["matrix"], payload["dense"]
+
+    def _save_cache(self, cache_path: Path):
+        payload = {
+            "version": self.CACHE_VERSION,
+            "sklearn": sklearn.__version__,
+            "kb_data": self.kb_data,
+            "vectorizer": self.vectorizer,
+            "matrix": self.matrix,
+            "dense": self._M,
+        }
+        # Unique temp file per writer so concurrent cold starts never share one
+        try:
+            fd, tmp_name = tempfile.mkstemp(
+                dir=cache_path.parent, prefix=cache_path.name + ".", suffix=".tmp"
+            )
+        except OSError:
+            # Read-only deployments simply rebuild the index on each start
+            return
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # mkstemp creates 0600 files; keep the cache readable when it
+                # is built by another user (image build, root shell)
+                os.fchmod(f.fileno(), 0o644)
+                pickle.dump(payload, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_name, cache_path)
+        except Exception:
+            # The cache is optional (disk full, unpicklable data...): the
+            # index is simply rebuilt on the next start
+            pass
+        finally:
+            # The temp file only remains if writing or replacing failed
+            if os.path.exists(tmp_name):
+                try:
+                    os.remove(tmp_name)
+                except OSError:
+                    pass
+
+    def _transform(self, query: str):
+        return self.vectorizer.transform([query])
+
+    def _similarities(self, query: str):
+        # Query vectors also come out L2-normalized (or all zeros)
+        q = self._vec(query).toarray().astype(np.float32).ravel()
+        return self._M @ q
+
     def answer(self, query: str) -> Tuple[str, float, dict]:
         if not query or not query.strip():
             return (
@@ -60,12 +157,12 @@ class CyberFAQAgent:
                 0.0,
                 {}
             )
+        return self._answer_from_sims(self._similarities(query))
 
-        vec = self.vectorizer.transform([query])
-        sims = cosine_similarity(vec, self.matrix)[0]
+    def _answer_from_sims(self, sims) -> Tuple[str, float, dict]:
         best_idx = int(sims.argmax())
         best_score = float(sims[best_idx])
-        best_row = self.df.iloc[best_idx].to_dict()
+        best_row = self.faq[best_idx]
 
         if best_score >= self.min_similarity:
             return best_row.get("answer", ""), best_score, best_row
@@ -90,12 +187,27 @@ class CyberFAQAgent:
         """Return top_k related FAQ entries with their similarity scores."""
         if not query or not query.strip():
             return []
-        vec = self.vectorizer.transform([query])
-        sims = cosine_similarity(vec, self.matrix)[0]
-        idxs = sims.argsort()[::-1][:top_k]
+        return self._search_from_sims(self._similarities(query), top_k)
+
+    def _search_from_sims(self, sims, top_k: int) -> List[Tuple[dict, float]]:
+        k = min(top_k, sims.size)
+        if k <= 0:
+            return []
+        # Partial selection in O(n), then sort only the k best entries
+        part = np.argpartition(-sims, k - 1)[:k]
+        idxs = part[np.argsort(-sims[part])]
         results = []
         for i in idxs:
             score = float(sims[int(i)])
             if score >= 0.10:  # Only return relevant results
-                results.append((self.df.iloc[int(i)].to_dict(), score))
+                results.append((self.faq[int(i)], score))
         return results
+
+    def answer_and_search(
+        self, query: str, top_k: int = 3
+    ) -> Tuple[Tuple[str, float, dict], List[Tuple[dict, float]]]:
+        """Return answer() and search() results, computing similarities once."""
+        if not query or not query.strip():
+            return self.answer(query), []
+        sims = self._similarities(query)
+        return self._answer_from_sims(sims), self._search_from_sims(sims, top_k)
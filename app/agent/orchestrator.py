@@ -2,7 +2,7 @@ from __future__ import annotations
 from typing import Dict, List, Tuple
 from pathlib import Path
 from dataclasses import dataclass
-import yaml
+import re
 
 from app.agent.faq_agent import CyberFAQAgent
 from app.db.database import ConversationDB
@@ -24,67 +24,154 @@ class AgentResponse:
             self.suggestions = []
 
 
+def _normalize(text: str) -> str:
+    """Lowercase and fold accents/punctuation used by detect_intent."""
+    t = text.lower()
+    return (
+        t.replace("'", " ").replace("-", " ").replace("é", "e").replace("è", "e")
+        .replace("ê", "e").replace("ë", "e").replace("à", "a").replace("ç", "c")
+    )
+
+
+def _compile_keywords(keywords: List[str]) -> re.Pattern:
+    # Keywords go through the same normalization as the user text
+    return re.compile("|".join(re.escape(_normalize(k)) for k in keywords))
+
+
 class CyberOrchestrator:
+    _GREETING_KEYWORDS = ["bonjour", "salut", "bonsoir", "hello", "hi", "hey", "coucou"]
+
+    _INTENT_KEYWORDS = {
+        "phishing_incident": [
+            "phishing", "hameçonnage", "hameconnage", "email suspect", 
+            "mail suspect", "lien suspect", "lien douteux", "ai clique", 
+            "j ai clique", "clique sur", "piege", "arnaque", "scam",
+            "frauduleux", "usurpation", "recu un mail", "email bizarre",
+            "suspect", "douteux", "etrange"
+        ],
+        "password_security": [
+            "mot de passe", "password", "mdp", "gestionnaire", "complexe",
+            "securise", "robuste", "fort", "faible", "creer un mot",
+            "changer mot", "oublie mot", "reset password", "perdu mot",
+            "bloque", "verrouille", "probleme mot", "compte bloque"
+        ],
+        "mfa": [
+            "mfa", "2fa", "authentification", "double authentification",
+            "multifacteur", "code", "verification", "token", "otp",
+            "deux facteurs", "validation"
+        ],
+        "vpn": [
+            "vpn", "reseau", "a distance", "remote", "connexion",
+            "distant", "tunnel", "wifi public", "reseau public",
+            "travail distance", "teletravail"
+        ],
+        "updates": [
+            "mise a jour", "maj", "patch", "correctif", "update",
+            "installer", "mettre a jour", "version", "upgrade"
+        ],
+        "data_sensitivity": [
+            "donnees sensibles", "donnees", "rgpd", "confidentiel",
+            "partage", "fichier", "document", "transfert", "sensitive",
+            "partager fichier", "envoyer fichier", "donnee"
+        ],
+        "incident_reporting": [
+            "incident", "signaler", "securite", "compromis", "support",
+            "alerte", "probleme", "attaque", "breach", "violation",
+            "contacter", "aide", "urgence"
+        ],
+    }
+
+    # One compiled alternation per intent instead of a substring loop,
+    # built once with the class so detect_intent has no per-call setup
+    _GREETING_PATTERN = _compile_keywords(_GREETING_KEYWORDS)
+    _INTENT_PATTERNS = {
+        intent: _compile_keywords(keywords)
+        for intent, keywords in _INTENT_KEYWORDS.items()
+    }
+
+    _GREETING_MESSAGE = (
+        "Bonjour ! Je suis CyberGuard, votre assistant en cybersécurité. "
+        "Je peux vous aider avec : le phishing, les mots de passe, la MFA, "
+        "le VPN, les mises à jour, la gestion des données sensibles, et le signalement d'incidents. "
+        "Comment puis-je vous aider ?"
+    )
+    _GREETING_QUESTIONS = (
+        "🔐 Comment créer un mot de passe solide ?",
+        "🚨 Comment détecter un email suspect ?",
+        "🔑 Qu'est-ce que la MFA ?",
+    )
+
+    _PHISHING_MESSAGE = (
+        "Compris. Pour un potentiel hameçonnage, restons méthodiques. "
+        "Je vais vous guider étape par étape."
+    )
+    _PHISHING_STEPS = (
+        "Ne cliquez plus dans l'email et n'ouvrez pas les pièces jointes.",
+        "Si vous avez entré des identifiants, changez-les immédiatement et activez la MFA.",
+        "Capturez les éléments (expéditeur, sujet, lien) et signalez l'email à la sécurité.",
+    )
+    _PHISHING_FOLLOW_UP = (
+        "Avez-vous entré des identifiants ou téléchargé une pièce jointe après avoir cliqué ?"
+    )
+
+    _GENERIC_STEPS = {
+        "password_security": (
+            "Utilisez un gestionnaire de mots de passe fourni par l'organisation.",
+            "Créez un mot de passe d'au moins 12 caractères mélangeant majuscules, minuscules, chiffres et symboles.",
+            "Activez la MFA sur tous vos comptes critiques.",
+            "Ne réutilisez jamais le même mot de passe."
+        ),
+        "mfa": (
+            "Préférez les applications d'authentification (Google Authenticator, Microsoft Authenticator) aux SMS.",
+            "Gardez des codes de secours dans un coffre sécurisé.",
+            "Activez la MFA sur tous les comptes qui le permettent."
+        ),
+        "vpn": (
+            "Téléchargez le client VPN depuis le portail IT de votre organisation.",
+            "Activez le VPN avant d'accéder à toute ressource interne.",
+            "Utilisez toujours le VPN sur les réseaux publics ou non fiables.",
+            "Fermez la session VPN après usage."
+        ),
+        "updates": (
+            "Appliquez les patchs critiques dans les 48 heures.",
+            "Installez les patchs normaux dans les 2 semaines.",
+            "Redémarrez l'appareil après un patch critique.",
+            "Vérifiez que la mise à jour s'est bien appliquée."
+        ),
+        "data_sensitivity": (
+            "Utilisez uniquement les outils homologués pour partager des fichiers sensibles.",
+            "Chiffrez les données en transit (HTTPS/TLS) et au repos.",
+            "Limitez l'accès aux personnes vraiment autorisées.",
+            "Appliquez le principe du moindre privilège."
+        ),
+        "incident_reporting": (
+            "Collectez les éléments (logs, captures, emails) sans les altérer.",
+            "Contactez immédiatement l'équipe sécurité (ne pas attendre).",
+            "Créez un ticket dans le système GRC si disponible.",
+            "Notifiez votre manager de la situation."
+        ),
+        "general": (
+            "Vérifiez toujours l'expéditeur des emails.",
+            "Utilisez des mots de passe robustes et uniques.",
+            "Activez la MFA partout où c'est possible.",
+            "En cas de doute, contactez l'équipe sécurité."
+        ),
+    }
+
     def __init__(self, kb_path: Path | None = None, db_path: Path | None = None):
         self.faq = CyberFAQAgent(kb_path=kb_path)
         self.db = ConversationDB(db_path=db_path)
         
-        # Load guidance
-        if kb_path is None:
-            kb_path = Path(__file__).parent / "knowledge_base.yaml"
-        with open(kb_path, "r", encoding="utf-8") as f:
-            data = yaml.safe_load(f)
-        self.guidance = data.get("guidance", {})
+        # Guidance comes from the knowledge base already parsed by the FAQ agent
+        self.guidance = self.faq.kb_data.get("guidance", {})
 
     def detect_intent(self, text: str) -> str:
-        t = text.lower()
-        t = t.replace("'", " ").replace("-", " ").replace("é", "e").replace("è", "e").replace("ê", "e")
-        greeting_keywords = ["bonjour", "salut", "bonsoir", "hello", "hi", "hey", "coucou"]
-        if any(k in t for k in greeting_keywords):
+        t = _normalize(text)
+        if self._GREETING_PATTERN.search(t):
             return "greeting"
 
-        intent_keywords = {
-            "phishing_incident": [
-                "phishing", "hameçonnage", "hameconnage", "email suspect", 
-                "mail suspect", "lien suspect", "lien douteux", "ai clique", 
-                "j ai clique", "clique sur", "piege", "arnaque", "scam",
-                "frauduleux", "usurpation", "recu un mail", "email bizarre",
-                "suspect", "douteux", "etrange"
-            ],
-            "password_security": [
-                "mot de passe", "password", "mdp", "gestionnaire", "complexe",
-                "securise", "robuste", "fort", "faible", "creer un mot",
-                "changer mot", "oublie mot", "reset password", "perdu mot",
-                "bloque", "verrouille", "probleme mot", "compte bloque"
-            ],
-            "mfa": [
-                "mfa", "2fa", "authentification", "double authentification",
-                "multifacteur", "code", "verification", "token", "otp",
-                "deux facteurs", "validation"
-            ],
-            "vpn": [
-                "vpn", "reseau", "a distance", "remote", "connexion",
-                "distant", "tunnel", "wifi public", "reseau public",
-                "travail distance", "teletravail"
-            ],
-            "updates": [
-                "mise a jour", "maj", "patch", "correctif", "update",
-                "installer", "mettre a jour", "version", "upgrade"
-            ],
-            "data_sensitivity": [
-                "donnees sensibles", "donnees", "rgpd", "confidentiel",
-                "partage", "fichier", "document", "transfert", "sensitive",
-                "partager fichier", "envoyer fichier", "donnee"
-            ],
-            "incident_reporting": [
-                "incident", "signaler", "securite", "compromis", "support",
-                "alerte", "probleme", "attaque", "breach", "violation",
-                "contacter", "aide", "urgence"
-            ],
-        }
-        
-        for intent, keywords in intent_keywords.items():
-            if any(k in t for k in keywords):
+        for intent, pattern in self._INTENT_PATTERNS.items():
+            if pattern.search(t):
                 return intent
         
         return "general"
@@ -99,48 +186,28 @@ class CyberOrchestrator:
         
         # Greeting
         if intent == "greeting":
-            msg = (
-                "Bonjour ! Je suis CyberGuard, votre assistant en cybersécurité. "
-                "Je peux vous aider avec : le phishing, les mots de passe, la MFA, "
-                "le VPN, les mises à jour, la gestion des données sensibles, et le signalement d'incidents. "
-                "Comment puis-je vous aider ?"
-            )
+            msg = self._GREETING_MESSAGE
             tip = self.faq.tip()
-            self.db.save_conversation(user_id, user_text, msg, intent)
-            self.db.increment_metric("question_asked", intent)
-            suggestions = [
-                ({"question": "🔐 Comment créer un mot de passe solide ?"}, 1.0),
-                ({"question": "🚨 Comment détecter un email suspect ?"}, 1.0),
-                ({"question": "🔑 Qu'est-ce que la MFA ?"}, 1.0)
-            ]
+            suggestions = [({"question": q}, 1.0) for q in self._GREETING_QUESTIONS]
+            self.db.record_turn(user_id, user_text, msg, intent)
             return AgentResponse(message=msg, steps=[], suggestions=suggestions, tip=tip, intent=intent)
         
         # Phishing incident
         if intent == "phishing_incident":
-            msg = (
-                "Compris. Pour un potentiel hameçonnage, restons méthodiques. "
-                "Je vais vous guider étape par étape."
-            )
-            steps = [
-                "Ne cliquez plus dans l'email et n'ouvrez pas les pièces jointes.",
-                "Si vous avez entré des identifiants, changez-les immédiatement et activez la MFA.",
-                "Capturez les éléments (expéditeur, sujet, lien) et signalez l'email à la sécurité.",
-            ]
+            msg = self._PHISHING_MESSAGE
+            steps = list(self._PHISHING_STEPS)
             suggestions = [(q.get("question", ""), s) for (q, s) in self.faq.search(user_text, top_k=3)]
             tip = self.faq.tip()
             session["pending_flow"] = "phishing_followup"
-            follow_up = (
-                "Avez-vous entré des identifiants ou téléchargé une pièce jointe après avoir cliqué ?"
-            )
+            follow_up = self._PHISHING_FOLLOW_UP
             enriched = self._enrich_md(intent)
             msg = msg + enriched
-            self.db.save_conversation(user_id, user_text, msg, intent)
-            self.db.increment_metric("question_asked", intent)
+            self.db.record_turn(user_id, user_text, msg, intent)
             return AgentResponse(message=msg, steps=steps, suggestions=suggestions, tip=tip, follow_up=follow_up, intent=intent)
 
         # Default: leverage FAQ + provide structured guidance
-        answer, score, meta = self.faq.answer(user_text)
-        suggestions = [(q.get("question", ""), s) for (q, s) in self.faq.search(user_text, top_k=3)]
+        (answer, score, meta), related = self.faq.answer_and_search(user_text, top_k=3)
+        suggestions = [(q.get("question", ""), s) for (q, s) in related]
         steps = self._generic_steps(intent)
         tip = self.faq.tip()
 
@@ -156,8 +223,7 @@ class CyberOrchestrator:
                 ({"question": "🔑 Activer la MFA"}, 1.0),
                 ({"question": "🛡️ Signaler un incident"}, 1.0),
             ]
-            self.db.save_conversation(user_id, user_text, msg, intent)
-            self.db.increment_metric("question_asked", intent)
+            self.db.record_turn(user_id, user_text, msg, intent)
             return AgentResponse(message=msg, steps=[], suggestions=suggestions, tip=tip, intent=intent)
 
         # Specialized fallback for mot de passe oublié/bloqué
@@ -174,8 +240,7 @@ class CyberOrchestrator:
             msg = (answer + self._enrich_md(intent)) if score >= 0.3 else (answer + self._enrich_md("general"))
         
         # Log to database
-        self.db.save_conversation(user_id, user_text, msg, intent)
-        self.db.increment_metric("question_asked", intent)
+        self.db.record_turn(user_id, user_text, msg, intent)
         
         return AgentResponse(message=msg, steps=steps, suggestions=suggestions, tip=tip, intent=intent)
 
@@ -213,75 +278,31 @@ class CyberOrchestrator:
 
         tip = self.faq.tip()
         suggestions = []
-        self.db.save_conversation(user_id, user_text, msg, "phishing_followup")
+        self.db.record_turn(user_id, user_text, msg, "phishing_followup", metric_name=None)
         return AgentResponse(message=msg, steps=steps, suggestions=suggestions, tip=tip, intent="phishing_followup")
 
     def _generic_steps(self, intent: str) -> List[str]:
-        mapping = {
-            "password_security": [
-                "Utilisez un gestionnaire de mots de passe fourni par l'organisation.",
-                "Créez un mot de passe d'au moins 12 caractères mélangeant majuscules, minuscules, chiffres et symboles.",
-                "Activez la MFA sur tous vos comptes critiques.",
-                "Ne réutilisez jamais le même mot de passe."
-            ],
-            "mfa": [
-                "Préférez les applications d'authentification (Google Authenticator, Microsoft Authenticator) aux SMS.",
-                "Gardez des codes de secours dans un coffre sécurisé.",
-                "Activez la MFA sur tous les comptes qui le permettent."
-            ],
-            "vpn": [
-                "Téléchargez le client VPN depuis le portail IT de votre organisation.",
-                "Activez le VPN avant d'accéder à toute ressource interne.",
-                "Utilisez toujours le VPN sur les réseaux publics ou non fiables.",
-                "Fermez la session VPN après usage."
-            ],
-            "updates": [
-                "Appliquez les patchs critiques dans les 48 heures.",
-                "Installez les patchs normaux dans les 2 semaines.",
-                "Redémarrez l'appareil après un patch critique.",
-                "Vérifiez que la mise à jour s'est bien appliquée."
-            ],
-            "data_sensitivity": [
-                "Utilisez uniquement les outils homologués pour partager des fichiers sensibles.",
-                "Chiffrez les données en transit (HTTPS/TLS) et au repos.",
-                "Limitez l'accès aux personnes vraiment autorisées.",
-                "Appliquez le principe du moindre privilège."
-            ],
-            "incident_reporting": [
-                "Collectez les éléments (logs, captures, emails) sans les altérer.",
-                "Contactez immédiatement l'équipe sécurité (ne pas attendre).",
-                "Créez un ticket dans le système GRC si disponible.",
-                "Notifiez votre manager de la situation."
-            ],
-            "general": [
-                "Vérifiez toujours l'expéditeur des emails.",
-                "Utilisez des mots de passe robustes et uniques.",
-                "Activez la MFA partout où c'est possible.",
-                "En cas de doute, contactez l'équipe sécurité."
-            ],
-        }
-        return mapping.get(intent, mapping["general"])
+        # Constants are tuples; hand out a fresh list so responses stay independent
+        return list(self._GENERIC_STEPS.get(intent, self._GENERIC_STEPS["general"]))
 
     def _enrich_md(self, intent: str) -> str:
         g = self.guidance.get(intent)
         if not g:
             return ""
         
-        output = "\n\n**Contexte :** " + g.get("why", "")
+        parts = ["\n\n**Contexte :** ", g.get("why", "")]
         
         best = g.get("best_practices", [])
         if best:
-            output += "\n\n**Bonnes pratiques :**\n"
-            for bp in best:
-                output += f"• {bp}\n"
+            parts.append("\n\n**Bonnes pratiques :**\n")
+            parts.extend(f"• {bp}\n" for bp in best)
         
         mistakes = g.get("common_mistakes", [])
         if mistakes:
-            output += "\n**Erreurs courantes :**\n"
-            for m in mistakes:
-                output += f"⚠️ {m}\n"
+            parts.append("\n**Erreurs courantes :**\n")
+            parts.extend(f"⚠️ {m}\n" for m in mistakes)
         
-        return output
+        return "".join(parts)
 
     def get_history(self, user_id: str, limit: int = 10) -> List[Dict]:
         """Return user conversation history."""
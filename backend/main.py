@@ -1,7 +1,9 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
 from pathlib import Path
+import asyncio
 import sys
 
 # Add parent directory to path
@@ -9,7 +11,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from app.agent.orchestrator import CyberAwarenessAgent
 
-app = FastAPI(title="CyberGuard API", version="1.0")
+app = FastAPI(title="CyberGuard API", version="1.0", default_response_class=ORJSONResponse)
 
 # CORS configuration
 app.add_middleware(
@@ -20,15 +22,20 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize agent lazily
+# Agent is built at startup so the first request does not pay for warm-up
 db_path = Path(__file__).parent.parent / "conversations.db"
 agent = None
 
-def get_agent():
+@app.on_event("startup")
+async def _startup():
     global agent
-    if agent is None:
-        agent = CyberAwarenessAgent(db_path=str(db_path))
-    return agent
+    agent = CyberAwarenessAgent(db_path=str(db_path))
+
+@app.on_event("shutdown")
+async def _shutdown():
+    # Closing runs PRAGMA optimize and lets SQLite checkpoint the WAL
+    if agent is not None:
+        agent.db.close()
 
 # ============================================================================
 # Models
@@ -60,18 +67,20 @@ async def chat(request: MessageRequest):
         user_id = request.user_id or "anonymous"
         session = request.session or {}
         
-        # Get response from agent
-        agent_instance = get_agent()
-        resp = agent_instance.respond(request.message, session, user_id=user_id)
+        # Get response from agent; respond() blocks (SQLite I/O, scoring),
+        # so it runs in a worker thread to keep the event loop free
+        resp = await asyncio.to_thread(agent.respond, request.message, session, user_id)
         
-        return MessageResponse(
-            id=user_id,
-            response=resp.message,
-            steps=resp.steps or [],
-            suggestions=[(q, float(s)) for q, s in (resp.suggestions or [])] if resp.suggestions else [],
-            tip=resp.tip or "",
-            follow_up=resp.follow_up or ""
-        )
+        # The payload shape is fixed, so serialize it straight through orjson
+        # instead of building and re-encoding a MessageResponse
+        return ORJSONResponse(content={
+            "id": user_id,
+            "response": resp.message,
+            "steps": resp.steps or [],
+            "suggestions": [(q, float(s)) for q, s in (resp.suggestions or [])] if resp.suggestions else [],
+            "tip": resp.tip or "",
+            "follow_up": resp.follow_up or ""
+        })
     except Exception as e:
         print(f"Error: {e}")
         import traceback